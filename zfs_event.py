@@ -94,13 +94,17 @@ class ZFSEvent(event.PosixTimeEvent):
          to the timestamp.
       posix_time: (inherited) is the timestamp; it may be None if
          the exact time is unkown but can be determined later
-         from the TXG.
+         from the TXG. PosixTimeEvent requires a timestamp, so None
+         is stored as 0 - a placeholder which places the event at
+         the epoch (1970-01-01 00:00:00 UTC) in the timeline.
       txg: is the zpool Transaction Group in which this event
          occurred and is REQUIRED.
       pool_guid: is the GUID of the zpool and is REQUIRED to avoid
          clashes and make use of the TXG values if events from
          multiple pools are combined into the same timeline.
       """
+      if timestamp is None:
+         timestamp = 0 # Unknown time placeholder, see above
       super(ZFSEvent, self).__init__(int(timestamp),\
                                      usage, data_type) # PosixTimeEvent
       #self.timestamp = timestamp # for UML purposes only XXX
@@ -158,6 +162,7 @@ class ZFSFileModifyEvent(ZFSEvent):
    / level 0 BPs of that file (if it uses Indirect Blocks).
    TXG is the BP TXG,
    timestamp is the file's MTime (the top level BP) or None (any later l0 BPs)
+   NOTE: Events with a None timestamp are placed at the epoch, see ZFSEvent.
    """
 
    DATA_TYPE = "fs:zfs:file:modify"
@@ -180,3 +185,44 @@ class ZFSFileModifyEvent(ZFSEvent):
       super(ZFSFileModifyEvent, self).__init__(pool_guid, bptxg, \
          "mtime", self.DATA_TYPE, mtime)
       self.fileobj = fileobj
+
+class ZFSSpaceMapEvent(ZFSEvent):
+   """SuperClass for ZFS Space Map Events. Each one summarises all the space
+   map entries of one type (allocated or freed segments) recorded for one
+   metaslab in one TXG.
+   Space maps only record the TXG, so there is no timestamp; it must be
+   determined later from the TXG (e.g. from the uberblocks). Until then these
+   events are placed at the epoch, see ZFSEvent.
+   """
+
+   def __init__(self, pool_guid, txg, vdev, metaslab, segments, size):
+      """Initializes a ZFS Space Map Event.
+
+      Arguments / Attributes:
+      pool_guid: is the GUID of the zpool
+      txg: The TXG recorded in the space map for these segments
+      vdev: The top level vdev ID containing the metaslab
+      metaslab: The metaslab ID within that vdev
+      segments: The number of segments allocated or freed
+      size: The total size of those segments in bytes
+      """
+      super(ZFSSpaceMapEvent, self).__init__(pool_guid, txg, \
+         self.USAGE, self.DATA_TYPE)
+      self.vdev = vdev
+      self.metaslab = metaslab
+      self.segments = segments
+      self.size = size
+
+class ZFSSpaceMapAllocEvent(ZFSSpaceMapEvent):
+   """Class for a ZFS Space Map Allocation Event - space in a metaslab was
+   allocated (written) in this TXG."""
+
+   DATA_TYPE = "fs:zfs:spacemap:alloc"
+   USAGE = "ZFS-spacemap-alloc"
+
+class ZFSSpaceMapFreeEvent(ZFSSpaceMapEvent):
+   """Class for a ZFS Space Map Free Event - space in a metaslab was freed
+   in this TXG."""
+
+   DATA_TYPE = "fs:zfs:spacemap:free"
+   USAGE = "ZFS-spacemap-free"
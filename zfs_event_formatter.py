@@ -59,9 +59,34 @@ class ZFSFileModifyEventFormatter(eventdata.EventFormatter):
 
    DATA_TYPE = "fs:zfs:file:modify"
 
-   # TODO: Use ConditionalEventFormatter? This seems to be working correctly
-   # if there are none with Timestamp=None, as the POSIXTimeEvent requires
-   # timestamp anyway
+   # TODO: Use ConditionalEventFormatter? Not needed while ZFSEvent stores a
+   # None timestamp as 0 (the epoch), as the POSIXTimeEvent requires one
    FORMAT_STRING = u'Modify: Pool: {pool_guid} TXG: {txg} Path: {fileobj}'
    SOURCE_LONG = "ZFS File Modify"
    SOURCE_SHORT = 'ZFS'
+
+class ZFSSpaceMapAllocEventFormatter(eventdata.EventFormatter):
+   """Formatter for a ZFS Space Map Allocation Event, summarising the
+   segments allocated in one metaslab in one TXG.
+   NOTE: Space maps do not record a timestamp, only the TXG.
+   """
+
+   DATA_TYPE = "fs:zfs:spacemap:alloc"
+   FORMAT_STRING = (u'Space Map Alloc: Pool: {pool_guid} TXG: {txg} '
+                    u'Vdev: {vdev} Metaslab: {metaslab} '
+                    u'Segments: {segments} Size: {size}')
+   SOURCE_LONG = "ZFS Space Map Alloc"
+   SOURCE_SHORT = 'ZFS'
+
+class ZFSSpaceMapFreeEventFormatter(eventdata.EventFormatter):
+   """Formatter for a ZFS Space Map Free Event, summarising the segments
+   freed in one metaslab in one TXG.
+   NOTE: Space maps do not record a timestamp, only the TXG.
+   """
+
+   DATA_TYPE = "fs:zfs:spacemap:free"
+   FORMAT_STRING = (u'Space Map Free: Pool: {pool_guid} TXG: {txg} '
+                    u'Vdev: {vdev} Metaslab: {metaslab} '
+                    u'Segments: {segments} Size: {size}')
+   SOURCE_LONG = "ZFS Space Map Free"
+   SOURCE_SHORT = 'ZFS'
@@ -0,0 +1,397 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Dylan Leigh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Result cache and event batching for the ZFS ZDB Parsers
+
+   Events parsed from a ZDB dump are stored on disk, keyed by a hash of the
+   dump contents, the parser name and the timezone. Re-running a parser over
+   the same dump replays the stored events instead of parsing it again.
+
+   All the ZDB parsers return their events through ZFSZDBParseHelper, which
+   handles the cache and groups the events into batches.
+"""
+
+__author__ = 'Dylan Leigh (research.dylanleigh.net)'
+
+import hashlib
+import logging
+import marshal
+import os
+import struct
+import tempfile
+import time
+import zlib
+
+from plaso.events import zfs_event
+
+from plaso.lib import event
+
+# Changing the record format MUST change this so old cache files are not used.
+# Each parser also has a CACHE_VERSION class attribute, which MUST be bumped
+# when a change to the parser changes the events it returns, so results cached
+# by older versions are not replayed. Both are part of the cache key.
+CACHE_VERSION = 2
+
+CACHE_SUFFIX = '.zdbcache'
+TMP_SUFFIX = CACHE_SUFFIX + '.tmp' # Cache files still being written
+
+# Defaults for the options, see GetOption.
+# Number of events in each batch handed to Plaso (zfs_batch_size); 1 returns
+# one event at a time. Batching is off by default as it has not been shown to
+# be faster, see BatchEvents.
+BATCH_SIZE = 1
+# Directory for the result cache (zfs_cache_dir); None disables the cache.
+CACHE_DIR = None
+
+def GetOption(config, name, default, convert=str):
+   """Return the value of option name (e.g. "zfs_cache_dir") from the Plaso
+   config object if it is set there, otherwise from the environment variable
+   of the same name in upper case (e.g. ZFS_CACHE_DIR), otherwise default.
+   log2timeline.py has no command line flags for these options, so the
+   environment variables are the usual way to set them."""
+   value = getattr(config, name, None)
+   if value is not None:
+      return value
+   value = os.environ.get(name.upper())
+   if not value:
+      return default
+   try:
+      return convert(value)
+   except ValueError:
+      logging.warning(u'Invalid %s, using %s: %s'%(name.upper(), default, value))
+      return default
+
+def GetCache(config):
+   """Return a ZFSZDBCache if the zfs_cache_dir option is set, otherwise None
+   (caching disabled)."""
+   cache_dir = GetOption(config, 'zfs_cache_dir', CACHE_DIR)
+   if not cache_dir:
+      return None
+   max_size = GetOption(config, 'zfs_cache_size', ZFSZDBCache.MAX_SIZE, int)
+   return ZFSZDBCache(cache_dir, max_size)
+
+class ZFSEventBatch(event.EventContainer):
+   """Container for a batch of ZFS Events from one of the ZDB parsers.
+   NOTE: Attributes set on an EventContainer are inherited by the events in
+   it, so nothing other than the events should be stored here.
+   """
+
+def BatchEvents(events, batch_size):
+   """Group events into ZFSEventBatch containers of batch_size events each.
+   The last batch may be smaller.
+
+   NOTE: This only reduces the number of objects the parser yields. The Plaso
+   worker unpacks each container and still filters, serializes and queues the
+   events one at a time, and each event gets a parent_container reference.
+
+   A batch_size of 1 or less yields the events unchanged.
+
+   If parsing fails part way, the events already parsed are yielded before
+   the exception is re-raised.
+   """
+   if batch_size <= 1:
+      for event_object in events:
+         yield event_object
+      return
+
+   batch = ZFSEventBatch()
+   count = 0
+   error = None
+   try:
+      for event_object in events:
+         batch.Append(event_object)
+         count += 1
+         if count >= batch_size:
+            yield batch
+            batch = ZFSEventBatch()
+            count = 0
+   except Exception as err:
+      # Yielding inside the except clause can lose the exception in Python 2,
+      # so keep it and log the original traceback instead.
+      logging.debug(u'Parse failed, flushing last batch', exc_info=True)
+      error = err
+   if count:
+      yield batch
+   if error is not None:
+      raise error
+
+class ZFSZDBParseHelper(object):
+   """Returns the events from a ZDB parser, using the result cache if the
+   zfs_cache_dir option is set, in batches of zfs_batch_size."""
+
+   MAX_HEADER_LENGTH = 400
+
+   def __init__(self, config):
+      """ZFS ZDB parse helper constructor, config is the parser config."""
+      self.batch_size = GetOption(config, 'zfs_batch_size', BATCH_SIZE, int)
+      self.cache = GetCache(config) # None if disabled
+
+   def Parse(self, zdb_parser, parse, filehandle, zone):
+      """Return the events from parse(filehandle) for zdb_parser, or from the
+      cache if it has been parsed before with the same timezone (zone)."""
+      # Plaso offers every file to every parser, so only hash the file for
+      # the cache once the parser has accepted its header.
+      if self.cache is None or not self.VerifyHeader(zdb_parser, filehandle):
+         events = parse(filehandle)
+      else:
+         events = self.cache.Parse(parse, filehandle, zdb_parser.NAME,
+            zdb_parser.CACHE_VERSION, zone)
+      return BatchEvents(events, self.batch_size)
+
+   def VerifyHeader(self, zdb_parser, filehandle):
+      """Return True if the first non-blank line of filehandle passes
+      zdb_parser.VerifyStructure. Leaves filehandle at offset 0."""
+      filehandle.seek(0)
+      line = filehandle.readline(self.MAX_HEADER_LENGTH)
+      while line and not line.strip():
+         line = filehandle.readline(self.MAX_HEADER_LENGTH)
+      filehandle.seek(0)
+      return zdb_parser.VerifyStructure(line.strip())
+
+class ZFSZDBCache(object):
+   """On-disk cache of parsed ZFS events.
+
+   Each cache file holds the events from one parser run over one ZDB dump.
+   Events are stored as (data_type, pool_guid, txg, posix_time, extra) records
+   in chunks of CHUNK_SIZE records; each chunk is marshalled, compressed with
+   zlib and prefixed with its length, so both writing and replay stream. A
+   zero length chunk marks the end of the file, so truncation is detected.
+
+   The cache directory is kept under max_size bytes by removing the least
+   recently used files; the mtime of a cache file is updated on each hit.
+   Temporary files left by runs that were killed are removed once they have
+   not been written to for TMP_MAX_AGE seconds.
+   """
+
+   MAX_SIZE = 1024 * 1024 * 1024 # 1GB
+   CHUNK_SIZE = 1000 # Records per compressed chunk
+   HASH_BLOCK_SIZE = 1024 * 1024
+   TMP_MAX_AGE = 24 * 60 * 60 # 1 day
+
+   CHUNK_HEADER = struct.Struct('>I') # Compressed chunk length
+
+   def __init__(self, cache_dir, max_size=MAX_SIZE):
+      """ZFS ZDB cache constructor."""
+      self.cache_dir = cache_dir
+      self.max_size = max_size
+
+   def GetKey(self, filehandle, parser_name, parser_version, zone):
+      """Return the cache key for the contents of filehandle as parsed by
+      version parser_version of parser_name with timezone zone. Leaves
+      filehandle at offset 0."""
+      content_hash = hashlib.md5()
+      filehandle.seek(0)
+      data = filehandle.read(self.HASH_BLOCK_SIZE)
+      while data:
+         content_hash.update(data)
+         data = filehandle.read(self.HASH_BLOCK_SIZE)
+      filehandle.seek(0)
+
+      key_hash = hashlib.md5()
+      key_hash.update('%d\0%s\0%d\0%s\0' % \
+         (CACHE_VERSION, parser_name, parser_version, zone))
+      key_hash.update(content_hash.digest())
+      return key_hash.hexdigest()
+
+   def Parse(self, parse, filehandle, parser_name, parser_version, zone):
+      """Yield the events from parse(filehandle), replaying them from the
+      cache if this dump has been parsed before with the same parser version
+      and timezone, or storing them in the cache if not."""
+      try:
+         key = self.GetKey(filehandle, parser_name, parser_version, zone)
+      except IOError as err:
+         logging.warning(u'Unable to hash file for ZDB cache: %s'%(err,))
+         return parse(filehandle)
+
+      path = os.path.join(self.cache_dir, key + CACHE_SUFFIX)
+      if os.path.isfile(path):
+         logging.debug(u'ZDB cache hit: %s'%(path,))
+         return self.Replay(path, parse, filehandle)
+
+      logging.debug(u'ZDB cache miss: %s'%(path,))
+      return self.Store(path, parse(filehandle))
+
+   def Replay(self, path, parse, filehandle):
+      """Yield the events stored in the cache file at path.
+
+      A corrupt or truncated cache file is removed. If that is found before
+      any events have been yielded, the dump is parsed with parse(filehandle)
+      (and cached again) instead. Otherwise the error is raised, so the run
+      fails for this file rather than silently returning part of it."""
+      try:
+         os.utime(path, None) # Most recently used
+      except OSError as err:
+         logging.warning(u'Unable to touch ZDB cache file: %s'%(err,))
+
+      yielded = False
+      corrupt = False
+      try:
+         with open(path, 'rb') as cache_file:
+            length, = self.CHUNK_HEADER.unpack(
+               cache_file.read(self.CHUNK_HEADER.size))
+            while length:
+               data = cache_file.read(length)
+               if len(data) != length:
+                  raise EOFError(u'Truncated chunk')
+               for record in marshal.loads(zlib.decompress(data)):
+                  event_object = self.RecordToEvent(record)
+                  yielded = True
+                  yield event_object
+               length, = self.CHUNK_HEADER.unpack(
+                  cache_file.read(self.CHUNK_HEADER.size))
+      except (struct.error, zlib.error, ValueError, EOFError, TypeError):
+         logging.error(u'Corrupt ZDB cache file removed: %s'%(path,))
+         try:
+            os.remove(path)
+         except OSError as err:
+            logging.warning(u'Unable to remove ZDB cache file: %s'%(err,))
+         if yielded:
+            raise
+         corrupt = True
+
+      if corrupt:
+         for event_object in self.Store(path, parse(filehandle)):
+            yield event_object
+
+   def Store(self, path, events):
+      """Yield events, writing them to the cache file at path as they pass.
+      The file is only added to the cache once all events have been parsed."""
+      try:
+         if not os.path.isdir(self.cache_dir):
+            os.makedirs(self.cache_dir)
+         fd, tmp_path = tempfile.mkstemp(dir=self.cache_dir, suffix=TMP_SUFFIX)
+         cache_file = os.fdopen(fd, 'wb')
+      except (IOError, OSError) as err:
+         logging.warning(u'Unable to create ZDB cache file: %s'%(err,))
+         for event_object in events:
+            yield event_object
+         return
+
+      completed = False
+      try:
+         records = []
+         for event_object in events:
+            if cache_file is not None:
+               records.append(self.EventToRecord(event_object))
+               if len(records) >= self.CHUNK_SIZE:
+                  cache_file = self.WriteChunk(cache_file, records)
+                  records = []
+            yield event_object
+         if cache_file is not None and records:
+            cache_file = self.WriteChunk(cache_file, records)
+         if cache_file is not None:
+            cache_file = self.WriteChunk(cache_file, []) # End of file
+         if cache_file is not None:
+            cache_file.close()
+            try:
+               os.rename(tmp_path, path)
+               completed = True
+            except OSError as err:
+               logging.warning(u'Unable to add ZDB cache file: %s'%(err,))
+      finally:
+         if not completed:
+            # Parse failed or was abandoned, don't cache a partial result
+            try:
+               if cache_file is not None:
+                  cache_file.close()
+               os.remove(tmp_path)
+            except (IOError, OSError) as err:
+               logging.warning(u'Unable to remove ZDB cache file: %s'%(err,))
+
+      self.Evict()
+
+   def WriteChunk(self, cache_file, records):
+      """Write a compressed chunk of records to cache_file and return it, or
+      return None if it could not be written (caching is abandoned). No
+      records writes the end of file marker."""
+      if records:
+         data = zlib.compress(marshal.dumps(records))
+      else:
+         data = ''
+      try:
+         cache_file.write(self.CHUNK_HEADER.pack(len(data)))
+         cache_file.write(data)
+      except IOError as err:
+         logging.warning(u'Unable to write ZDB cache file: %s'%(err,))
+         cache_file.close()
+         return None
+      return cache_file
+
+   def Evict(self):
+      """Remove stale temporary files, then least recently used cache files
+      until the total size of the cache directory is no more than max_size.
+      Temporary files still being written count towards the total."""
+      try:
+         entries = []
+         total = 0
+         stale_time = time.time() - self.TMP_MAX_AGE
+         for name in os.listdir(self.cache_dir):
+            path = os.path.join(self.cache_dir, name)
+            if name.endswith(TMP_SUFFIX):
+               stat = os.stat(path)
+               if stat.st_mtime < stale_time:
+                  logging.debug(u'Removing stale ZDB cache file: %s'%(path,))
+                  os.remove(path)
+               else:
+                  total += stat.st_size
+               continue
+            if not name.endswith(CACHE_SUFFIX):
+               continue
+            stat = os.stat(path)
+            entries.append((stat.st_mtime, stat.st_size, path))
+            total += stat.st_size
+
+         entries.sort()
+         for mtime, size, path in entries:
+            if total <= self.max_size:
+               break
+            logging.debug(u'Evicting ZDB cache file: %s'%(path,))
+            os.remove(path)
+            total -= size
+      except OSError as err:
+         logging.warning(u'Unable to evict from ZDB cache: %s'%(err,))
+
+   def EventToRecord(self, event_object):
+      """Return a marshallable record tuple for a ZFSEvent."""
+      # Plaso timestamps are in microseconds, the events take POSIX time
+      posix_time = event_object.timestamp // 1000000
+      if event_object.data_type in (zfs_event.ZFSFileCreateEvent.DATA_TYPE,
+                                    zfs_event.ZFSFileModifyEvent.DATA_TYPE):
+         extra = event_object.fileobj
+      elif event_object.data_type in (
+            zfs_event.ZFSSpaceMapAllocEvent.DATA_TYPE,
+            zfs_event.ZFSSpaceMapFreeEvent.DATA_TYPE):
+         extra = (event_object.vdev, event_object.metaslab,
+                  event_object.segments, event_object.size)
+      else:
+         extra = None
+      return (event_object.data_type, event_object.pool_guid,
+              event_object.txg, posix_time, extra)
+
+   def RecordToEvent(self, record):
+      """Return a new ZFSEvent from a record tuple made by EventToRecord."""
+      data_type, pool_guid, txg, posix_time, extra = record
+      if data_type == zfs_event.ZFSUberBlockEvent.DATA_TYPE:
+         return zfs_event.ZFSUberBlockEvent(pool_guid, txg, posix_time)
+      elif data_type == zfs_event.ZFSFileCreateEvent.DATA_TYPE:
+         return zfs_event.ZFSFileCreateEvent(pool_guid, txg, extra, posix_time)
+      elif data_type == zfs_event.ZFSFileModifyEvent.DATA_TYPE:
+         return zfs_event.ZFSFileModifyEvent(pool_guid, txg, extra, posix_time)
+      elif data_type == zfs_event.ZFSSpaceMapAllocEvent.DATA_TYPE:
+         return zfs_event.ZFSSpaceMapAllocEvent(pool_guid, txg, *extra)
+      elif data_type == zfs_event.ZFSSpaceMapFreeEvent.DATA_TYPE:
+         return zfs_event.ZFSSpaceMapFreeEvent(pool_guid, txg, *extra)
+      else:
+         raise ValueError(u'Unknown event type in ZDB cache: %s'%(data_type,))
@@ -0,0 +1,216 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Dylan Leigh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the result cache used by the ZFS ZDB Parsers"""
+
+import io
+import os
+import shutil
+import struct
+import tempfile
+import time
+import unittest
+
+from plaso.events import zfs_event
+from plaso.parsers import zfs_zdb_cache
+
+DUMP = 'MOS Configuration:\n        pool_guid: 1234\n'
+
+def GetEvents():
+   """Return one event of each type stored in the cache."""
+   return [
+      zfs_event.ZFSUberBlockEvent('1234', 10, 1380000000),
+      zfs_event.ZFSFileCreateEvent('1234', 11, '/tank/a', 1380000100),
+      zfs_event.ZFSFileModifyEvent('1234', 12, '/tank/a', 1380000200),
+      zfs_event.ZFSFileModifyEvent('1234', 13, '/tank/a'), # No mtime
+      zfs_event.ZFSSpaceMapAllocEvent('1234', 14, 0, 1, 2, 0x1200),
+      zfs_event.ZFSSpaceMapFreeEvent('1234', 15, 1, 0, 1, 0x200)]
+
+def GetSummary(event_object):
+   """Return all the stored attributes of an event."""
+   return (event_object.data_type, event_object.pool_guid, event_object.txg,
+           event_object.timestamp, event_object.timestamp_desc,
+           getattr(event_object, 'fileobj', None),
+           getattr(event_object, 'vdev', None),
+           getattr(event_object, 'metaslab', None),
+           getattr(event_object, 'segments', None),
+           getattr(event_object, 'size', None))
+
+def FailParse(filehandle):
+   """Parse function for runs which should replay from the cache."""
+   raise AssertionError(u'Parsed instead of replaying from the cache')
+
+class ZFSZDBCacheTest(unittest.TestCase):
+   """Tests for the ZFS ZDB result cache."""
+
+   def setUp(self):
+      """Creates an empty cache directory."""
+      self.cache_dir = tempfile.mkdtemp()
+      self.cache = zfs_zdb_cache.ZFSZDBCache(self.cache_dir)
+
+   def tearDown(self):
+      """Removes the cache directory."""
+      shutil.rmtree(self.cache_dir)
+
+   def CacheParse(self, parse, data=DUMP):
+      """Return the events from the cache for data as a list."""
+      return list(self.cache.Parse(parse, io.BytesIO(data),
+                                   'zfs_zdb_test', 1, u'UTC'))
+
+   def GetCacheFiles(self):
+      """Return the names of the files in the cache directory."""
+      return sorted(os.listdir(self.cache_dir))
+
+   def MakeFile(self, name, size, age):
+      """Create a file of size bytes in the cache directory, last modified
+      age seconds ago."""
+      path = os.path.join(self.cache_dir, name)
+      with open(path, 'wb') as cache_file:
+         cache_file.write('x' * size)
+      mtime = time.time() - age
+      os.utime(path, (mtime, mtime))
+
+   def testRoundTrip(self):
+      """Tests each event type is the same after store and replay."""
+      expected = [GetSummary(e) for e in GetEvents()]
+      stored = self.CacheParse(lambda filehandle: GetEvents())
+      self.assertEqual([GetSummary(e) for e in stored], expected)
+      self.assertEqual(len(self.GetCacheFiles()), 1)
+
+      replayed = self.CacheParse(FailParse)
+      self.assertEqual([GetSummary(e) for e in replayed], expected)
+      # The placeholder timestamp for a modify event without mtime
+      self.assertEqual(replayed[3].timestamp, 0)
+
+   def testRoundTripChunks(self):
+      """Tests replay of events stored over several chunks."""
+      self.cache.CHUNK_SIZE = 4
+      events = GetEvents() * 3
+      self.CacheParse(lambda filehandle: events)
+      replayed = self.CacheParse(FailParse)
+      self.assertEqual([GetSummary(e) for e in replayed],
+                       [GetSummary(e) for e in events])
+
+   def testKey(self):
+      """Tests the key changes with the dump, parser, timezone and versions."""
+      def GetKey(data=DUMP, name='zfs_zdb_test', version=1, zone=u'UTC'):
+         return self.cache.GetKey(io.BytesIO(data), name, version, zone)
+
+      key = GetKey()
+      self.assertEqual(GetKey(), key)
+      self.assertNotEqual(GetKey(data=DUMP + '\n'), key)
+      self.assertNotEqual(GetKey(name='zfs_zdb_other'), key)
+      self.assertNotEqual(GetKey(version=2), key)
+      self.assertNotEqual(GetKey(zone=u'Australia/Melbourne'), key)
+
+      cache_version = zfs_zdb_cache.CACHE_VERSION
+      try:
+         zfs_zdb_cache.CACHE_VERSION = cache_version + 1
+         self.assertNotEqual(GetKey(), key)
+      finally:
+         zfs_zdb_cache.CACHE_VERSION = cache_version
+
+   def testEvict(self):
+      """Tests least recently used cache files are removed first."""
+      self.cache.max_size = 250
+      self.MakeFile('a' + zfs_zdb_cache.CACHE_SUFFIX, 100, 300)
+      self.MakeFile('b' + zfs_zdb_cache.CACHE_SUFFIX, 100, 100)
+      self.MakeFile('c' + zfs_zdb_cache.CACHE_SUFFIX, 100, 200)
+      self.MakeFile('other', 1000, 400) # Not a cache file, ignored
+      self.cache.Evict()
+      self.assertEqual(self.GetCacheFiles(),
+                       ['b' + zfs_zdb_cache.CACHE_SUFFIX,
+                        'c' + zfs_zdb_cache.CACHE_SUFFIX, 'other'])
+
+      self.cache.max_size = 150
+      self.cache.Evict()
+      self.assertEqual(self.GetCacheFiles(),
+                       ['b' + zfs_zdb_cache.CACHE_SUFFIX, 'other'])
+
+   def testEvictReplayed(self):
+      """Tests a replayed cache file becomes the most recently used."""
+      self.CacheParse(lambda filehandle: GetEvents())
+      name, = self.GetCacheFiles()
+      size = os.path.getsize(os.path.join(self.cache_dir, name))
+      self.MakeFile('newer' + zfs_zdb_cache.CACHE_SUFFIX, size, 0)
+      path = os.path.join(self.cache_dir, name)
+      os.utime(path, (time.time() - 100, time.time() - 100))
+
+      self.CacheParse(FailParse)
+      self.cache.max_size = size
+      self.cache.Evict()
+      self.assertEqual(self.GetCacheFiles(), [name])
+
+   def testEvictTemporary(self):
+      """Tests stale temporary files are removed and fresh ones kept."""
+      max_age = zfs_zdb_cache.ZFSZDBCache.TMP_MAX_AGE
+      self.MakeFile('old' + zfs_zdb_cache.TMP_SUFFIX, 100, max_age + 60)
+      self.MakeFile('new' + zfs_zdb_cache.TMP_SUFFIX, 100, 60)
+      self.cache.Evict()
+      self.assertEqual(self.GetCacheFiles(),
+                       ['new' + zfs_zdb_cache.TMP_SUFFIX])
+
+      # Fresh temporary files count towards the size of the cache
+      self.cache.max_size = 150
+      self.MakeFile('a' + zfs_zdb_cache.CACHE_SUFFIX, 100, 60)
+      self.cache.Evict()
+      self.assertEqual(self.GetCacheFiles(),
+                       ['new' + zfs_zdb_cache.TMP_SUFFIX])
+
+   def testStoreFailed(self):
+      """Tests nothing is cached if parsing fails part way."""
+      def BadParse(filehandle):
+         yield GetEvents()[0]
+         raise ValueError(u'Parse failed')
+
+      self.assertRaises(ValueError, self.CacheParse, BadParse)
+      self.assertEqual(self.GetCacheFiles(), [])
+
+   def testCorrupt(self):
+      """Tests a corrupt cache file is removed and the dump parsed again."""
+      self.CacheParse(lambda filehandle: GetEvents())
+      name, = self.GetCacheFiles()
+      with open(os.path.join(self.cache_dir, name), 'wb') as cache_file:
+         cache_file.write(struct.pack('>I', 10) + 'not zlib..')
+
+      events = self.CacheParse(lambda filehandle: GetEvents())
+      self.assertEqual([GetSummary(e) for e in events],
+                       [GetSummary(e) for e in GetEvents()])
+      # Replaced by a good cache file
+      self.assertEqual(self.GetCacheFiles(), [name])
+      self.assertEqual(len(self.CacheParse(FailParse)), len(GetEvents()))
+
+   def testTruncated(self):
+      """Tests a truncated cache file is removed, failing the run if events
+      have already been returned from it."""
+      self.cache.CHUNK_SIZE = 4
+      self.CacheParse(lambda filehandle: GetEvents())
+      name, = self.GetCacheFiles()
+      path = os.path.join(self.cache_dir, name)
+      with open(path, 'rb+') as cache_file:
+         cache_file.truncate(os.path.getsize(path) - 4) # No end marker
+
+      events = []
+      def ReplayAll():
+         for event_object in self.cache.Parse(FailParse, io.BytesIO(DUMP),
+                                              'zfs_zdb_test', 1, u'UTC'):
+            events.append(event_object)
+
+      self.assertRaises(struct.error, ReplayAll)
+      self.assertEqual(len(events), len(GetEvents()))
+      self.assertEqual(self.GetCacheFiles(), [])
+
+if __name__ == '__main__':
+   unittest.main()
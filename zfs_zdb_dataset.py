@@ -28,6 +28,8 @@ import pytz
 
 from plaso.events import zfs_event
 
+from plaso.parsers import zfs_zdb_cache
+
 from plaso.lib import timelib
 from plaso.lib import text_parser
 
@@ -74,6 +76,7 @@ class ZFSZDBDatasetParser(text_parser.PyparsingSingleLineTextParser):
 
    NAME = "zfs_zdb_dataset"
    #ENCODING = 'utf-8' # TODO: raw?
+   CACHE_VERSION = 1 # see zfs_zdb_cache
 
    #  PYPARSING VARS
    # LITERALS
@@ -174,6 +177,7 @@ class ZFSZDBDatasetParser(text_parser.PyparsingSingleLineTextParser):
        """ZFS ZDB Dataset parser object constructor."""
        super(ZFSZDBDatasetParser, self).__init__(pre_obj, config)
        self.offset = 0
+       self.zdb_helper = zfs_zdb_cache.ZFSZDBParseHelper(config)
 
        self.local_zone = getattr(pre_obj, 'zone', pytz.utc) # Timezone XXX
        
@@ -214,6 +218,11 @@ class ZFSZDBDatasetParser(text_parser.PyparsingSingleLineTextParser):
          return zfs_event.ZFSFileCreateEvent(self.curr_pool_guid, txg, \
             self.curr_obj_path, time)
 
+   def Parse(self, filehandle):
+      """Extract events from the file, see ZFSZDBParseHelper."""
+      return self.zdb_helper.Parse(self, super(ZFSZDBDatasetParser, self).Parse,
+         filehandle, unicode(self.local_zone))
+
    def ParseRecord(self, key, structure):
       """Parse each record structure and return an EventObject if applicable."""
 
@@ -27,6 +27,8 @@ import pyparsing
 
 from plaso.events import zfs_event
 
+from plaso.parsers import zfs_zdb_cache
+
 from plaso.lib import text_parser
 
 class ZFSZDBVdevLabelParser(text_parser.PyparsingSingleLineTextParser):
@@ -43,6 +45,7 @@ class ZFSZDBVdevLabelParser(text_parser.PyparsingSingleLineTextParser):
 
    NAME = "zfs_zdb_label"
    #ENCODING = 'utf-8' # TODO: raw?
+   CACHE_VERSION = 1 # see zfs_zdb_cache
 
    #  PYPARSING VARS
    # LITERALS
@@ -82,6 +85,7 @@ class ZFSZDBVdevLabelParser(text_parser.PyparsingSingleLineTextParser):
        """ZFS ZDB Vdev Label parser object constructor."""
        super(ZFSZDBVdevLabelParser, self).__init__(pre_obj, config)
        self.offset = 0
+       self.zdb_helper = zfs_zdb_cache.ZFSZDBParseHelper(config)
        #self.local_zone = getattr(pre_obj, 'zone', pytz.utc)
        
        self.curr_pool_guid = None
@@ -109,6 +113,12 @@ class ZFSZDBVdevLabelParser(text_parser.PyparsingSingleLineTextParser):
          logging.debug(u'Create event with txg and time: %s %s'%(txg,time))
          return zfs_event.ZFSUberBlockEvent(self.curr_pool_guid, txg, time)
 
+   def Parse(self, filehandle):
+      """Extract events from the file, see ZFSZDBParseHelper."""
+      # Uberblock timestamps are UTC, the timezone doesn't affect them
+      return self.zdb_helper.Parse(self, \
+         super(ZFSZDBVdevLabelParser, self).Parse, filehandle, u'')
+
    def ParseRecord(self, key, structure):
       """Parse each record structure and return an EventObject if applicable."""
 
@@ -0,0 +1,211 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Dylan Leigh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Parser for ZFS Metaslab Space Maps from ZDB
+   i.e. output of "zdb -P -C -mmmm <pool>"
+
+   Space map dumps are even larger than dataset dumps, so unlike the other
+   parsers this one does not use pyparsing; lines are classified with plain
+   string tests, most common first.
+"""
+
+__author__ = 'Dylan Leigh (research.dylanleigh.net)'
+
+import logging
+
+from plaso.events import zfs_event
+
+from plaso.parsers import zfs_zdb_cache
+
+from plaso.lib import errors
+from plaso.lib import parser
+
+class ZFSZDBSpaceMapParser(parser.BaseParser):
+   """Parses "zdb -P -C -mmmm <pool>" for space map allocation/free events
+
+   Using a line by line parser:
+
+   1) If "pool_guid: <guid>" (from the -C config) extract to add to events.
+      The pool GUID is required, so the file must start with the -C config
+      and contain pool_guid before the first metaslab.
+   2) If vdev header, save the vdev ID
+   3) If metaslab header, spawn events for the previous metaslab and save
+      the metaslab ID
+   4) If a space map debug entry, save its TXG for the following entries
+   5) If a space map range entry, add its size to the ALLOC or FREE counters
+      for the current TXG. Events are only created when the metaslab is
+      finished, one per (vdev, metaslab, txg) for each of ALLOC and FREE.
+   6) If any other section header (an unindented line, e.g. "Log Space Maps
+      in Pool:"), spawn events and forget the vdev and metaslab, so space
+      maps outside the Metaslabs section are not counted against the last
+      metaslab.
+
+   Vdev header:
+	vdev          0
+	metaslabs   116   offset                spacemap          free
+	...
+   Metaslab header:
+	metaslab      0   offset            0   spacemap     38   free    2.39G
+	...
+   Space map entries:
+	    [     0]    ALLOC: txg 1356, pass 1
+	    [     1]    A  range: 0000000000-0000008000  size: 008000
+	    [     2]    F  range: 0000080000-0000090000  size: 010000
+	...
+   """
+
+   NAME = "zfs_zdb_spacemap"
+   CACHE_VERSION = 1 # see zfs_zdb_cache
+
+   # Line checked by VerifyStructure (blank lines are skipped); dumps without
+   # -C start with "Metaslabs:" and have no pool GUID, so they are rejected.
+   HEADER = "MOS Configuration:"
+
+   # Unindented lines which are part of a metaslab, not a new section
+   METASLAB_LINES = ("space map object ",)
+
+   # Index of the (segments, size) counters for each range entry type
+   ALLOC = 0
+   FREE = 2
+
+   def __init__(self, pre_obj, config=None):
+       """ZFS ZDB Space Map parser object constructor."""
+       super(ZFSZDBSpaceMapParser, self).__init__(pre_obj, config)
+       self.zdb_helper = zfs_zdb_cache.ZFSZDBParseHelper(config)
+       self.ResetState()
+
+   def ResetState(self):
+      """Clear all per-file state. Plaso reuses the parser for every file."""
+      self.curr_pool_guid = None
+      self.curr_vdev = None
+      self.curr_metaslab = None
+      self.curr_txg = None
+      # Counters for the current metaslab, TXG -> [alloc segments,
+      # alloc bytes, free segments, free bytes]
+      self.curr_txg_counters = {}
+      self.curr_counters = None # Counters for self.curr_txg
+
+   def VerifyStructure(self, line):
+      """Verify that this parser was given data from zdb -C -mmmm"""
+      if line != self.HEADER:
+         logging.debug(u'Unable to parse, Space Map Header not found')
+         return False
+      return True
+
+   def SpawnEvents(self):
+      """Create events from the counters for the current metaslab and reset
+      them. Returns a list of events, ordered by TXG."""
+      events = []
+      for txg in sorted(self.curr_txg_counters):
+         alloc_segments, alloc_size, free_segments, free_size = \
+            self.curr_txg_counters[txg]
+         if alloc_segments:
+            events.append(zfs_event.ZFSSpaceMapAllocEvent(self.curr_pool_guid,
+               txg, self.curr_vdev, self.curr_metaslab,
+               alloc_segments, alloc_size))
+         if free_segments:
+            events.append(zfs_event.ZFSSpaceMapFreeEvent(self.curr_pool_guid,
+               txg, self.curr_vdev, self.curr_metaslab,
+               free_segments, free_size))
+      logging.debug(u'Space map events for vdev/metaslab/txgs: %s %s %s'%\
+            (self.curr_vdev, self.curr_metaslab, len(self.curr_txg_counters)))
+
+      self.curr_txg = None
+      self.curr_txg_counters = {}
+      self.curr_counters = None
+      return events
+
+   def Parse(self, filehandle):
+      """Extract events from the file, see ZFSZDBParseHelper."""
+      # Space maps only contain TXGs, the timezone doesn't affect them
+      return self.zdb_helper.Parse(self, self.ParseLines, filehandle, u'')
+
+   def ParseLines(self, filehandle):
+      """Parse the file line by line, yielding the events for each metaslab
+      as it is finished."""
+      self.ResetState()
+      if not self.zdb_helper.VerifyHeader(self, filehandle):
+         raise errors.UnableToParseFile(u'Not a ZDB space map (-C -mmmm) dump.')
+
+      line = filehandle.readline()
+      while line:
+         # Truncated or odd lines are logged and skipped, as the pyparsing
+         # parsers do with unknown lines. Huge dumps are often cut off.
+         try:
+            # Range entries first because there are many of them
+            if 'range:' in line:
+               # Ignore any entries without a TXG or outside a metaslab
+               if self.curr_counters is not None:
+                  fields = line[line.index(']') + 1:].split()
+                  size = int(fields[fields.index('size:') + 1], 16)
+                  if fields[0] == 'A':
+                     index = self.ALLOC
+                  elif fields[0] == 'F':
+                     index = self.FREE
+                  else:
+                     raise ValueError(u'Unknown range type')
+                  self.curr_counters[index] += 1
+                  self.curr_counters[index + 1] += size
+
+            # Debug entries e.g. "[     0]    ALLOC: txg 1356, pass 1"
+            elif ': txg ' in line:
+               if self.curr_metaslab is not None:
+                  # Don't count following entries under the previous TXG
+                  self.curr_counters = None
+                  fields = line[line.index(']') + 1:].split()
+                  self.curr_txg = long(fields[2].rstrip(','))
+                  self.curr_counters = self.curr_txg_counters.setdefault(
+                     self.curr_txg, [0, 0, 0, 0])
+
+            elif line[0] not in ' \t' and line.strip() \
+                  and not line.startswith(self.METASLAB_LINES):
+               logging.debug(u'Matched section header: %s'%(line.strip(),))
+               for event_object in self.SpawnEvents():
+                  yield event_object
+               self.curr_vdev = None
+               self.curr_metaslab = None
+
+            else:
+               fields = line.split()
+               if not fields:
+                  pass
+               elif fields[0] == 'metaslab':
+                  logging.debug(u'Matched metaslab header: %s'%(fields,))
+                  if self.curr_pool_guid is None:
+                     raise errors.UnableToParseFile(
+                        u'No pool_guid before the first metaslab.')
+                  for event_object in self.SpawnEvents():
+                     yield event_object
+                  self.curr_metaslab = None
+                  self.curr_metaslab = long(fields[1])
+               elif fields[0] == 'vdev':
+                  logging.debug(u'Matched vdev header: %s'%(fields,))
+                  for event_object in self.SpawnEvents():
+                     yield event_object
+                  self.curr_vdev = None
+                  self.curr_metaslab = None
+                  self.curr_vdev = long(fields[1])
+               elif fields[0] == 'pool_guid:':
+                  logging.debug(u'Matched pool_guid: %s'%(fields,))
+                  self.curr_pool_guid = str(fields[1]) # Treat GUID as a str
+               # Other lines (histograms, config etc) ignored
+
+         except (ValueError, IndexError):
+            logging.debug(u'Unable to parse line, ignored: %s'%(line,))
+
+         line = filehandle.readline()
+
+      for event_object in self.SpawnEvents():
+         yield event_object
@@ -0,0 +1,128 @@
+#!/usr/bin/python
+#
+# Copyright 2014 Dylan Leigh
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#    http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Tests for the ZFS ZDB Space Map parser
+
+   The test file is "zdb -P -C -mmmm" output in the OpenZFS 0.8 format,
+   including the "Log Space Maps in Pool:" section after the metaslabs.
+"""
+
+import io
+import os
+import unittest
+
+from plaso.lib import errors
+from plaso.parsers import zfs_zdb_spacemap
+
+TEST_DATA = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                         'test_data', 'zfs_zdb_spacemap.txt')
+
+class TestConfig(object):
+   """Parser config returning events one at a time, without the cache."""
+   zfs_batch_size = 1
+   zfs_cache_dir = None
+
+class ZFSZDBSpaceMapParserTest(unittest.TestCase):
+   """Tests for the ZFS ZDB Space Map parser."""
+
+   def setUp(self):
+      """Sets up the parser and parses the test file."""
+      self.parser = zfs_zdb_spacemap.ZFSZDBSpaceMapParser(None, TestConfig())
+      with open(TEST_DATA, 'rb') as filehandle:
+         self.events = list(self.parser.Parse(filehandle))
+
+   def GetSummary(self, event_object):
+      """Return the interesting attributes of a space map event."""
+      return (event_object.data_type, event_object.txg, event_object.vdev,
+              event_object.metaslab, event_object.segments, event_object.size)
+
+   def testParse(self):
+      """Tests one event per (vdev, metaslab, txg) for each of ALLOC/FREE."""
+      self.assertEqual([self.GetSummary(e) for e in self.events], [
+         ('fs:zfs:spacemap:alloc', 4, 0, 0, 2, 0x1200),
+         ('fs:zfs:spacemap:free', 4, 0, 0, 1, 0x200),
+         ('fs:zfs:spacemap:alloc', 4510, 0, 0, 1, 0x400),
+         ('fs:zfs:spacemap:alloc', 4511, 0, 2, 1, 0x1000),
+         ('fs:zfs:spacemap:alloc', 4512, 1, 0, 1, 0x800),
+         ('fs:zfs:spacemap:free', 4512, 1, 0, 1, 0x200),
+      ])
+
+   def testPoolGuid(self):
+      """Tests the pool GUID from the MOS config is added to every event."""
+      for event_object in self.events:
+         self.assertEqual(event_object.pool_guid, '11867545473436476133')
+
+   def testLogSpaceMaps(self):
+      """Tests log space map entries are not counted against the last
+      metaslab of the last vdev."""
+      self.assertEqual([e for e in self.events if e.txg == 4520], [])
+
+   def testReuseParser(self):
+      """Tests nothing from a previous file is used when the parser is reused,
+      as Plaso does, for another file."""
+      with open(TEST_DATA, 'rb') as filehandle:
+         events = list(self.parser.Parse(filehandle))
+      self.assertEqual([self.GetSummary(e) for e in events],
+                       [self.GetSummary(e) for e in self.events])
+
+      no_guid = ('MOS Configuration:\n'
+                 '        version: 5000\n'
+                 '\n'
+                 'Metaslabs:\n'
+                 '\tvdev          0\n'
+                 '\tmetaslab      0   offset            0   spacemap'
+                 '    265   free    15.9M\n')
+      with self.assertRaises(errors.UnableToParseFile):
+         list(self.parser.Parse(io.BytesIO(no_guid)))
+
+   def testBadLines(self):
+      """Tests malformed and truncated lines are skipped without losing the
+      other entries."""
+      data = ('MOS Configuration:\n'
+              '        pool_guid: 1234\n'
+              '\n'
+              'Metaslabs:\n'
+              '\tvdev          0\n'
+              '\tmetaslab      0   offset            0   spacemap'
+              '    265   free    15.9M\n'
+              '\t    [     0] ALLOC: txg 4 pass 1\n'
+              '\t    [     1]    A  range: 0000000000-0000001000'
+              '  size: 001000 vdev: 000000 words: 1\n'
+              '\t    [     2]    A  range: 0000001000-0000002000  size: zz\n'
+              '\t    [     3] FREE: txg x, pass 1\n'
+              '\t    [     4]    F  range: 0000001000-0000001200'
+              '  size: 000200 vdev: 000000 words: 1\n'
+              '\t    [     5] FREE: txg 5 pass 1\n'
+              '\t    [     6]    F  range: 0000001000-0000001200  size:')
+      parser = zfs_zdb_spacemap.ZFSZDBSpaceMapParser(None, TestConfig())
+      events = list(parser.Parse(io.BytesIO(data)))
+      self.assertEqual([self.GetSummary(e) for e in events],
+                       [('fs:zfs:spacemap:alloc', 4, 0, 0, 1, 0x1000)])
+
+   def testNoPoolGuid(self):
+      """Tests dumps without a pool GUID (no -C option) are rejected."""
+      metaslabs = ('\n'
+                   'Metaslabs:\n'
+                   '\tvdev          0\n'
+                   '\tmetaslab      0   offset            0   spacemap'
+                   '    265   free    15.9M\n')
+      no_guid = 'MOS Configuration:\n        version: 5000\n' + metaslabs
+      for data in (metaslabs, no_guid):
+         parser = zfs_zdb_spacemap.ZFSZDBSpaceMapParser(None, TestConfig())
+         with self.assertRaises(errors.UnableToParseFile):
+            list(parser.Parse(io.BytesIO(data)))
+
+if __name__ == '__main__':
+   unittest.main()